@@ -1,5 +1,6 @@
 """Adapter factory for automatic adapter selection and fallback."""
 
+import asyncio
 import logging
 from typing import Optional
 from adapter.base import BaseAdapter
@@ -40,7 +41,7 @@ async def _create_adapter_with_fallback() -> BaseAdapter:
         logger.info("✓ Connected to Pico W firmware via USB serial")
         return adapter
     except Exception as e:
-        logger.warning(f"Pico W connection failed: {e}")
+        logger.warning("Pico W connection failed: %s", e)
         logger.info("Falling back to joycontrol adapter...")
     
     # Fallback to joycontrol adapter
@@ -50,7 +51,7 @@ async def _create_adapter_with_fallback() -> BaseAdapter:
         logger.info("✓ Connected via joycontrol Bluetooth adapter")
         return adapter
     except Exception as e:
-        logger.error(f"Joycontrol connection failed: {e}")
+        logger.error("Joycontrol connection failed: %s", e)
         raise RuntimeError(
             "Could not connect to any adapter!\n"
             "Troubleshooting:\n"
@@ -96,28 +97,32 @@ def get_available_adapters() -> list[str]:
     return adapters
 
 
-async def test_adapter_connectivity() -> dict[str, bool]:
-    """Test connectivity for all available adapters.
-    
-    Returns:
-        Dictionary mapping adapter names to connectivity status.
-    """
-    results = {}
-    
-    # Test Pico adapter
+async def _probe_pico() -> bool:
     try:
         adapter = await _create_pico_adapter()
         adapter.close()
-        results['pico'] = True
+        return True
     except Exception:
-        results['pico'] = False
-    
-    # Test joycontrol adapter  
+        return False
+
+
+async def _probe_joycontrol() -> bool:
     try:
-        adapter = await _create_joycontrol_adapter()
+        await _create_joycontrol_adapter()
         # Note: joycontrol doesn't have a close method
-        results['joycontrol'] = True
+        return True
     except Exception:
-        results['joycontrol'] = False
+        return False
+
+
+async def test_adapter_connectivity() -> dict[str, bool]:
+    """Test connectivity for all available adapters.
     
-    return results
\ No newline at end of file
+    The probes use separate transports (USB serial and Bluetooth), so they
+    run concurrently and the check takes as long as the slowest one.
+    
+    Returns:
+        Dictionary mapping adapter names to connectivity status.
+    """
+    pico, joycontrol = await asyncio.gather(_probe_pico(), _probe_joycontrol())
+    return {'pico': pico, 'joycontrol': joycontrol}
@@ -6,6 +6,7 @@ commands to a Nintendo Switch via Bluetooth.
 from __future__ import annotations
 
 import asyncio
+import re
 import serial
 import serial.tools.list_ports
 import logging
@@ -14,6 +15,10 @@ from adapter.base import BaseAdapter, Button, Stick
 
 logger = logging.getLogger(__name__)
 
+_PICO_VID = 0x2E8A  # Raspberry Pi Foundation VID
+# One case-insensitive scan instead of lower() plus a search per keyword
+_PICO_DESC_RE = re.compile(r'pico|rp2040|raspberry', re.IGNORECASE)
+
 
 class PicoAdapter(BaseAdapter):
     """Adapter that sends commands to Pico W firmware via USB serial."""
@@ -34,17 +39,16 @@ class PicoAdapter(BaseAdapter):
     async def connect(self) -> None:
         """Connect to the Pico W firmware via USB serial."""
         if self.port is None:
-            self.port = self._find_pico_port()
+            # comports() walks sysfs/the registry; keep it off the loop
+            self.port = await asyncio.to_thread(self._find_pico_port)
             if self.port is None:
                 raise RuntimeError("Could not find Pico W device. Make sure it's connected and firmware is running.")
         
-        logger.info(f"Connecting to Pico W on {self.port}")
+        logger.info("Connecting to Pico W on %s", self.port)
         
         # Open serial connection in a thread to avoid blocking
-        loop = asyncio.get_event_loop()
-        self.serial = await loop.run_in_executor(
-            None, 
-            lambda: serial.Serial(self.port, self.baud, timeout=self.timeout)
+        self.serial = await asyncio.to_thread(
+            serial.Serial, self.port, self.baud, timeout=self.timeout
         )
         
         # Wait a moment for the device to be ready
@@ -60,12 +64,11 @@ class PicoAdapter(BaseAdapter):
         
         for port in ports:
             # Look for Pico device characteristics
-            if port.vid == 0x2E8A:  # Raspberry Pi Foundation VID
+            if port.vid == _PICO_VID:
                 return port.device
                 
             # Alternative: look for common Pico device descriptions
-            if any(keyword in (port.description or "").lower() 
-                   for keyword in ["pico", "rp2040", "raspberry"]):
+            if port.description and _PICO_DESC_RE.search(port.description):
                 return port.device
         
         return None
@@ -80,10 +83,9 @@ class PicoAdapter(BaseAdapter):
             raise RuntimeError("Not connected to Pico. Call connect() first.")
         
         command_bytes = (command + '\n').encode('utf-8')
-        logger.debug(f"Sending command: {command}")
+        logger.debug("Sending command: %s", command)
         
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, self.serial.write, command_bytes)
+        await asyncio.to_thread(self.serial.write, command_bytes)
         
         # Small delay to allow command processing
         await asyncio.sleep(0.01)
@@ -10,7 +10,7 @@ import asyncio
 import time
 import sys
 from adapter.base import Button, Stick
-from macro_parser import parse_macro, run_macro
+from macros import parse_macro, run_macro
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -2,16 +2,23 @@
 
 Historically this repository exposed parse_macro and MacroRunner in
 `macro_parser.py`. The implementation has been split into smaller modules
-under `macros/`. This file re-exports the public API so existing imports
-continue to work.
+under `macros/`. Names are resolved lazily (PEP 562) so existing imports
+keep working without loading the macros package twice; new code should
+import from `macros` directly.
 """
 
-from macros.parser import parse_macro
-from macros.runner import run_macro, run_commands, MacroRunner
-
 __all__ = [
     'parse_macro',
     'run_macro',
     'run_commands',
     'MacroRunner',
-]
\ No newline at end of file
+]
+
+
+def __getattr__(name):
+    if name in __all__:
+        import macros
+        value = getattr(macros, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -64,7 +64,33 @@ async def run_macro(adapter, commands: List[Tuple[str, List[str]]], dry_run: boo
             raise ValueError(f'Unknown macro command: {cmd}')
 
 
-async def run_commands(adapter, commands: List[Tuple[str, List[str]]], *, log_queue: Queue | None = None, pause_event: Event | None = None, stop_event: Event | None = None):
+async def _sleep_unpaused(sec: float, pause_event: Event | None, stop_event: Event | None, wake_event: Event) -> bool:
+    """Sleep for ``sec`` seconds of unpaused time; return True if stopped.
+
+    ``wake_event`` is set whenever a pause or stop is requested, so the
+    sleep blocks on it instead of re-checking the other events on a timer.
+    """
+    loop = asyncio.get_running_loop()
+    remaining = sec
+    while remaining > 0:
+        # clear before checking so a request landing after the checks
+        # still wakes the wait below
+        wake_event.clear()
+        if stop_event is not None and stop_event.is_set():
+            return True
+        if pause_event is not None and not pause_event.is_set():
+            await pause_event.wait()
+            continue
+        start = loop.time()
+        try:
+            await asyncio.wait_for(wake_event.wait(), remaining)
+        except asyncio.TimeoutError:
+            return False
+        remaining -= loop.time() - start
+    return False
+
+
+async def run_commands(adapter, commands: List[Tuple[str, List[str]]], *, log_queue: Queue | None = None, pause_event: Event | None = None, stop_event: Event | None = None, wake_event: Event | None = None):
     from adapter.base import Button, Stick
 
     def log(msg: str):
@@ -98,6 +124,11 @@ async def run_commands(adapter, commands: List[Tuple[str, List[str]]], *, log_qu
         elif cmd == 'SLEEP':
             sec = float(args[0]) if args else 0.0
             log(f'SLEEP {sec}s')
+            if wake_event is not None:
+                if await _sleep_unpaused(sec, pause_event, stop_event, wake_event):
+                    log('stopped during sleep')
+                    return
+                continue
             remaining = sec
             interval = 0.1
             while remaining > 0:
@@ -138,6 +169,8 @@ class MacroRunner:
         self._pause_event = Event()
         self._pause_event.set()
         self._stop_event = Event()
+        # set on every pause/stop request so SLEEPs wake immediately
+        self._wake_event = Event()
 
     def set_commands(self, commands: List[Tuple[str, List[str]]]):
         self._commands = commands
@@ -153,7 +186,7 @@ class MacroRunner:
     async def start(self):
         if self._commands is None:
             raise RuntimeError('No commands set')
-        if isinstance(self._commands, list) and len(self._commands) == 0:
+        if not self._commands:
             if self.log_queue is not None:
                 try:
                     self.log_queue.put_nowait('MacroRunner: no commands to run')
@@ -175,7 +208,7 @@ class MacroRunner:
                             self.log_queue.put_nowait(f'=== iteration {iteration} start ===')
                         except Exception:
                             pass
-                    await run_commands(self.adapter, self._commands, log_queue=self.log_queue, pause_event=self._pause_event, stop_event=self._stop_event)
+                    await run_commands(self.adapter, self._commands, log_queue=self.log_queue, pause_event=self._pause_event, stop_event=self._stop_event, wake_event=self._wake_event)
                 except Exception as e:
                     if self.log_queue is not None:
                         try:
@@ -184,7 +217,8 @@ class MacroRunner:
                             pass
                     else:
                         print(f'Error during macro run: {e}')
-                await asyncio.sleep(0.1)
+                if not self._stop_event.is_set():
+                    await asyncio.sleep(0.1)
 
         self._task = asyncio.create_task(_loop())
 
@@ -193,6 +227,7 @@ class MacroRunner:
             return
         self._stop_event.set()
         self._pause_event.set()
+        self._wake_event.set()
         try:
             await self._task
         finally:
@@ -208,6 +243,7 @@ class MacroRunner:
 
     async def pause(self):
         self._pause_event.clear()
+        self._wake_event.set()
         try:
             await self.adapter.release_all_buttons()
         except Exception:
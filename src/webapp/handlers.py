@@ -4,148 +4,492 @@ Contains aiohttp handlers and embedded single-page HTML.
 """
 from __future__ import annotations
 
+import gzip
+import logging
+import os
 import pathlib
-import json
-import queue
+import re
 import asyncio
+import tempfile
+import time
 from aiohttp import web, WSMsgType
 from typing import Optional
 
+from .jsonutil import dumpb, loads
+
+try:
+    from adapter.factory import get_available_adapters, test_adapter_connectivity
+except ImportError:
+    get_available_adapters = None
+    test_adapter_connectivity = None
+
+logger = logging.getLogger(__name__)
+
 ROOT = pathlib.Path(__file__).parent.parent.parent
+MACROS_DIR = (ROOT / 'data' / 'macros').resolve()
+STATIC_DIR = (pathlib.Path(__file__).parent / 'static').resolve()
+INDEX_PATH = STATIC_DIR / 'index.html'
+# str forms for the per-request os.path fast paths
+_MACROS_DIR_STR = str(MACROS_DIR)
+
+# Commands a websocket client may forward verbatim to the worker
+_WS_COMMANDS = frozenset({'pause', 'resume', 'restart', 'stop'})
+_ADAPTER_TYPES = frozenset({None, 'pico', 'joycontrol'})
+
+_CONTENT_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'application/javascript; charset=utf-8',
+    '.json': 'application/json',
+    '.txt': 'text/plain; charset=utf-8',
+    '.png': 'image/png',
+    '.svg': 'image/svg+xml',
+    '.ico': 'image/x-icon',
+}
+
+
+def _get_content_type(filename: str) -> str:
+    # A miss (no dot, or a dot inside a directory name) falls through to
+    # octet-stream, same as an unknown suffix
+    i = filename.rfind('.')
+    ext = filename[i:].lower() if i >= 0 else ''
+    return _CONTENT_TYPES.get(ext, 'application/octet-stream')
+
+
+# Websocket frames are binary UTF-8 JSON; the page decodes them once
+_WS_CONNECTED = dumpb({'type': 'status', 'msg': 'connected'})
+_WS_BUSY = dumpb({'type': 'log', 'msg': 'Server busy: command dropped'})
+
+
+def _json(obj, status: int = 200) -> web.Response:
+    # body is already UTF-8 bytes, so aiohttp writes it without re-encoding
+    return web.Response(body=dumpb(obj), status=status, content_type='application/json')
+
+
+# Pre-encoded bodies for the fixed error replies. aiohttp responses are
+# single-use, so _error() still builds a new Response per call, but skips
+# str encoding and text/charset handling.
+_BAD_JSON = b'invalid JSON body'
+_NAME_REQUIRED = b'name required'
+_BAD_NAME = b'Invalid filename'
+_BAD_ADAPTER = b'Invalid adapter type'
+_NO_FACTORY = b'adapter factory unavailable'
+_BUSY = b'Too many pending commands'
+_TEXT_HEADERS = {'Content-Type': 'text/plain; charset=utf-8'}
+
+
+def _error(status: int, body: bytes) -> web.Response:
+    return web.Response(status=status, body=body, headers=_TEXT_HEADERS)
+
+
+def _enqueue(app, cmd) -> bool:
+    """Queue a command for the worker; False if the backlog is full."""
+    try:
+        app['cmd_pending'].put_nowait(cmd)
+    except asyncio.QueueFull:
+        return False
+    return True
+
+
+async def _read_json(request) -> Optional[dict]:
+    """Decode a JSON object body straight from the raw bytes.
+
+    Returns None when the body is not a valid JSON object.
+    """
+    try:
+        data = loads(await request.read())
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
 
-INDEX_HTML = None
+
+# Frames a websocket client may fall behind by before its oldest unsent
+# frames are discarded.
+_WS_SEND_QUEUE = 1024
+
+
+def push_frame(ws_q: asyncio.Queue, frame: bytes) -> None:
+    """Queue frame for a client, discarding its oldest frame when full.
+
+    A lagging page is better off missing old log lines than new ones, and
+    the bounded queue keeps a stalled client from growing without limit.
+    """
+    try:
+        ws_q.put_nowait(frame)
+    except asyncio.QueueFull:
+        ws_q.get_nowait()
+        ws_q.put_nowait(frame)
+
+
+async def _ws_sender(ws: web.WebSocketResponse, ws_q: asyncio.Queue):
+    try:
+        while True:
+            await ws.send_bytes(await ws_q.get())
+    except (ConnectionError, RuntimeError):
+        # peer went away; the handler's receive loop notices and cleans up
+        pass
 
 
 async def websocket_handler(request):
-    ws = web.WebSocketResponse()
+    # Server-side pings let aiohttp notice dead peers instead of waiting on
+    # TCP keepalive. permessage-deflate is off: every client would deflate
+    # the same broadcast frame separately, and log frames are a few dozen
+    # bytes, too small for compression to pay off.
+    ws = web.WebSocketResponse(heartbeat=20.0, compress=False)
     await ws.prepare(request)
     app = request.app
-    cmd_q: 'queue.Queue' = app['cmd_q']
-    logs_q: 'queue.Queue' = app['logs_ws_q']
+    connections: dict = app['websocket_connections']
+
+    # queue the greeting, then register for broadcasts with no await in
+    # between, so it always goes out first
+    ws_q: asyncio.Queue = asyncio.Queue(maxsize=_WS_SEND_QUEUE)
+    ws_q.put_nowait(_WS_CONNECTED)
+    # only pages that can inflate batches ask for them compressed (?z=1)
+    connections[ws] = (ws_q, request.query.get('z') == '1')
+    sender = asyncio.create_task(_ws_sender(ws, ws_q))
+    try:
+        async for msg in ws:
+            if msg.type == WSMsgType.TEXT:
+                try:
+                    data = loads(msg.data)
+                except Exception:
+                    data = {'cmd': msg.data}
+                cmd = data.get('cmd') if isinstance(data, dict) else None
+                # the allow-list is a set: only hash strings from the client
+                if isinstance(cmd, str) and cmd in _WS_COMMANDS:
+                    # no per-command ack: the worker broadcasts a status
+                    # frame when the runner state actually changes
+                    if not _enqueue(app, cmd):
+                        push_frame(ws_q, _WS_BUSY)
+            elif msg.type in (WSMsgType.CLOSE, WSMsgType.CLOSING, WSMsgType.CLOSED, WSMsgType.ERROR):
+                break
+    finally:
+        connections.pop(ws, None)
+        sender.cancel()
+    return ws
 
-    await ws.send_str(json.dumps({'type':'status','msg': 'connected'}))
 
-    loop = asyncio.get_event_loop()
+# Text assets that get a .gz sibling; FileResponse picks the sibling
+# itself when the client accepts gzip
+_PRECOMPRESS_SUFFIXES = frozenset({'.html', '.css', '.js'})
+# Static URLs carry no content hash (index.html links plain
+# /static/styles.css), so browsers always revalidate; that is a cheap 304
+# off the ETag, and an edited asset shows up on the next load
+_STATIC_CACHE_CONTROL = 'no-cache'
 
-    async def log_forwarder():
-        while True:
-            msg = await loop.run_in_executor(None, logs_q.get)
-            await ws.send_str(json.dumps({'type':'log','msg': msg}))
-
-    forwarder = asyncio.create_task(log_forwarder())
-
-    async for msg in ws:
-        if msg.type == WSMsgType.TEXT:
-            try:
-                data = json.loads(msg.data)
-            except Exception:
-                data = {'cmd': msg.data}
-            cmd = data.get('cmd')
-            if cmd in ('pause', 'resume', 'restart', 'stop'):
-                cmd_q.put(cmd)
-                await ws.send_str(json.dumps({'type':'status','msg': cmd}))
-        elif msg.type == WSMsgType.ERROR:
-            break
-
-    forwarder.cancel()
-    return ws
+
+def _gz_stale(path: pathlib.Path) -> bool:
+    """True when path's .gz sibling is missing or was built from another version.
+
+    A sibling carries its source's mtime (see _write_gz), so any edit,
+    even one made while the sibling was being written, shows up here.
+    """
+    try:
+        src_ns = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return False
+    try:
+        return path.with_name(path.name + '.gz').stat().st_mtime_ns != src_ns
+    except FileNotFoundError:
+        return True
+
+
+def _write_gz(path: pathlib.Path) -> None:
+    """(Re)write path's .gz sibling atomically.
+
+    Each call compresses into its own temp file and renames it into place,
+    so concurrent refreshes never see each other's partial output.
+    """
+    gz_path = path.with_name(path.name + '.gz')
+    try:
+        src_ns = path.stat().st_mtime_ns
+        data = gzip.compress(path.read_bytes(), compresslevel=9, mtime=0)
+        with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f'.{gz_path.name}.', suffix='.tmp', delete=False) as f:
+            tmp = f.name
+            f.write(data)
+        os.utime(tmp, ns=(src_ns, src_ns))
+    except OSError as e:
+        # read-only install: serve uncompressed rather than an outdated copy
+        logger.warning('Could not precompress %s: %s', path.name, e)
+        try:
+            gz_path.unlink()
+        except OSError:
+            pass
+        return
+    try:
+        os.replace(tmp, gz_path)
+    except OSError as e:
+        # the sibling itself is untouched; a later request retries
+        logger.warning('Could not replace %s: %s', gz_path.name, e)
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+
+def _ensure_gz(path: pathlib.Path) -> None:
+    if path.suffix in _PRECOMPRESS_SUFFIXES and _gz_stale(path):
+        _write_gz(path)
+
+
+def precompress_static() -> None:
+    """Write a .gz next to each text asset in STATIC_DIR that lacks a fresh one."""
+    for path in STATIC_DIR.iterdir():
+        if path.is_file():
+            _ensure_gz(path)
+
+
+async def _refresh_gz(path: pathlib.Path) -> None:
+    # FileResponse serves an existing .gz sibling without comparing it to
+    # the original, so an asset edited while the server runs is
+    # recompressed on its next request instead of served stale; the stat
+    # calls run in a thread like FileResponse's own
+    if path.suffix in _PRECOMPRESS_SUFFIXES:
+        await asyncio.to_thread(_ensure_gz, path)
+
+
+@web.middleware
+async def static_cache(request, handler):
+    is_static = request.path.startswith('/static/')
+    if is_static:
+        # precompress_static() only covers files directly in STATIC_DIR
+        name = request.path[8:]
+        if name and '/' not in name:
+            await _refresh_gz(STATIC_DIR / name)
+    resp = await handler(request)
+    if is_static:
+        resp.headers['Cache-Control'] = _STATIC_CACHE_CONTROL
+    return resp
 
 
 async def index(request):
     # serve the static html file
-    path = pathlib.Path(__file__).parent / 'static' / 'index.html'
-    return web.Response(text=path.read_text(), content_type='text/html')
+    # FileResponse uses sendfile() and answers conditional requests itself
+    await _refresh_gz(INDEX_PATH)
+    return web.FileResponse(INDEX_PATH, headers={'Content-Type': _get_content_type(INDEX_PATH.name)})
+
+
+def _scan_macros(sort: bool = True) -> list[str]:
+    with os.scandir(_MACROS_DIR_STR) as it:
+        # only names the get/save/select endpoints accept, so everything
+        # listed can also be opened and run
+        names = [e.name for e in it if e.is_file() and _is_safe_name(e.name)]
+    if sort:
+        names.sort()
+    return names
+
+
+# sort flag -> (directory st_mtime_ns, names). Adding, removing or
+# renaming a file bumps the directory mtime, so a matching mtime means the
+# cached listing is still current.
+_listing_cache: dict = {}
+# A listing scanned within this long of the directory's mtime is not
+# cached: a file created in the same timestamp tick would not change it.
+_LISTING_RACY_NS = 1_000_000_000
+
+
+async def _list_macros(sort: bool) -> list[str]:
+    mtime = os.stat(_MACROS_DIR_STR).st_mtime_ns
+    cached = _listing_cache.get(sort)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    # disk access runs in a worker thread so it never stalls the event loop
+    names = await asyncio.to_thread(_scan_macros, sort)
+    if time.time_ns() - mtime > _LISTING_RACY_NS:
+        _listing_cache[sort] = (mtime, names)
+    return names
+
+
+# Listings longer than this are streamed in chunks instead of being
+# encoded into one response body.
+_LIST_STREAM_THRESHOLD = 512
+_LIST_CHUNK = 256
 
 
 async def api_list_macros(request):
-    macros_dir = ROOT / 'data' / 'macros'
-    if not macros_dir.exists():
-        return web.json_response([], status=200)
-    names = [p.name for p in macros_dir.iterdir() if p.is_file()]
-    return web.json_response(sorted(names))
+    # ?sort=0 skips sorting for clients that don't need a stable order
+    sort = request.query.get('sort') != '0'
+    try:
+        names = await _list_macros(sort)
+    except FileNotFoundError:
+        return _json([])
+    if len(names) <= _LIST_STREAM_THRESHOLD:
+        return _json(names)
+
+    resp = web.StreamResponse(headers={'Content-Type': 'application/json'})
+    await resp.prepare(request)
+    sep = b'['
+    for i in range(0, len(names), _LIST_CHUNK):
+        chunk = b','.join(dumpb(n) for n in names[i:i + _LIST_CHUNK])
+        await resp.write(sep + chunk)
+        sep = b','
+    await resp.write(b']')
+    await resp.write_eof()
+    return resp
+
+
+# Macro filenames: letters, digits, '.', '_' and '-', no leading dot. This
+# rules out separators, '..', NUL and backslashes, so a valid name always
+# resolves inside the macros directory.
+_SAFE_NAME = re.compile(r'(?!\.)[A-Za-z0-9._-]{1,255}')
+
+
+def _is_safe_name(name) -> bool:
+    return isinstance(name, str) and _SAFE_NAME.fullmatch(name) is not None
+
+
+def _macro_path(name: str) -> str:
+    return os.path.join(_MACROS_DIR_STR, name)
+
+
+def _write_file(path: str, content: str) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
 
 
 async def api_get_macro(request):
     name = request.match_info['name']
-    from pathlib import Path
-    path = ROOT / 'data' / 'macros' / Path(name).name
-    if not path.exists():
+    if not _is_safe_name(name):
+        return _error(400, _BAD_NAME)
+    path = _macro_path(name)
+    if not os.path.isfile(path):
         return web.Response(status=404)
-    return web.Response(text=path.read_text(), content_type='text/plain')
+    # sendfile() straight from the page cache; no copy through Python
+    return web.FileResponse(path, headers=_TEXT_HEADERS)
 
 
 async def api_save_macro(request):
-    data = await request.json()
+    data = await _read_json(request)
+    if data is None:
+        return _error(400, _BAD_JSON)
     name = data.get('name')
     content = data.get('content', '')
     if not name:
-        return web.Response(status=400, text='name required')
-    from pathlib import Path
-    path = ROOT / 'data' / 'macros' / Path(name).name
-    path.write_text(content)
+        return _error(400, _NAME_REQUIRED)
+    if not _is_safe_name(name):
+        return _error(400, _BAD_NAME)
+    await asyncio.to_thread(_write_file, _macro_path(name), content)
     return web.Response(status=201)
 
 
 async def api_select_macro(request):
-    data = await request.json()
+    data = await _read_json(request)
+    if data is None:
+        return _error(400, _BAD_JSON)
     name = data.get('name')
     if not name:
-        return web.Response(status=400, text='name required')
-    cmd_q: 'queue.Queue' = request.app['cmd_q']
-    cmd_q.put(f'load:{name}')
+        return _error(400, _NAME_REQUIRED)
+    if not _is_safe_name(name):
+        return _error(400, _BAD_NAME)
+    if not _enqueue(request.app, ('load', name)):
+        return _error(503, _BUSY)
     return web.Response(status=200)
 
 
 async def api_stop(request):
-    cmd_q: 'queue.Queue' = request.app['cmd_q']
-    try:
-        cmd_q.put('stop')
-    except Exception:
-        pass
-    ev: Optional[asyncio.Event] = request.app.get('shutdown_event')
-    if ev is not None:
-        ev.set()
+    # a full backlog doesn't matter here: the server sends the worker
+    # 'stop' itself while shutting down
+    _enqueue(request.app, 'stop')
+    request.app['shutdown_event'].set()
     return web.Response(status=200)
 
 
-async def api_restart_host(request):
-    import subprocess
+# How long a power command may take to fail before we assume it is
+# going through (a successful shutdown may never report back)
+_POWER_CMD_TIMEOUT = 2.0
+
+
+async def _power_command(*args: str):
+    """Run a host power command without blocking the event loop.
+
+    `sudo -n` fails immediately instead of waiting on a password prompt, and
+    the child is exec'd directly (no shell). A failure, such as a missing
+    sudoers rule, shows up within _POWER_CMD_TIMEOUT; it is logged and
+    returned as a 500 with sudo's message. A command still running after
+    that is left alone and reported as accepted.
+    """
     try:
-        subprocess.Popen(['sudo', 'shutdown', '-r', 'now'])
+        proc = await asyncio.create_subprocess_exec(
+            'sudo', '-n', 'shutdown', *args,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
     except Exception as e:
         return web.Response(status=500, text=str(e))
+    try:
+        _, err = await asyncio.wait_for(proc.communicate(), _POWER_CMD_TIMEOUT)
+    except asyncio.TimeoutError:
+        return web.Response(status=200)
+    if proc.returncode != 0:
+        msg = err.decode(errors='replace').strip() or f'exit status {proc.returncode}'
+        logger.error('shutdown %s failed: %s', ' '.join(args), msg)
+        return web.Response(status=500, text=msg)
     return web.Response(status=200)
 
 
+async def api_restart_host(request):
+    return await _power_command('-r', 'now')
+
+
 async def api_stop_host(request):
-    import subprocess
-    try:
-        subprocess.Popen(['sudo', 'shutdown', '-h', 'now'])
-    except Exception as e:
-        return web.Response(status=500, text=str(e))
-    return web.Response(status=200)
+    return await _power_command('-h', 'now')
+
+
+async def api_status(request):
+    etag, body = request.app['macro_status'].encoded()
+    # no-cache: browsers may keep the body but must revalidate every poll,
+    # which costs a 304 with no body while nothing has changed
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if request.headers.get('If-None-Match') == etag:
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=body, content_type='application/json', headers=headers)
+
+
+# get_available_adapters() only probes imports, so a short TTL is plenty
+_ADAPTERS_TTL = 1.0
+_adapters_cache: dict = {'ts': 0.0, 'val': None}
+# in-flight connectivity probe shared by concurrent api_adapter_status calls
+_connectivity_task: Optional[asyncio.Task] = None
+
+
+def _cached_adapters() -> list[str]:
+    now = time.monotonic()
+    if _adapters_cache['val'] is None or now - _adapters_cache['ts'] >= _ADAPTERS_TTL:
+        _adapters_cache['val'] = get_available_adapters()
+        _adapters_cache['ts'] = now
+    return _adapters_cache['val']
+
+
+async def _shared_connectivity() -> dict[str, bool]:
+    global _connectivity_task
+    if _connectivity_task is None or _connectivity_task.done():
+        _connectivity_task = asyncio.ensure_future(test_adapter_connectivity())
+    # shield so one client disconnecting doesn't cancel the probe for others
+    return await asyncio.shield(_connectivity_task)
 
 
 async def api_list_adapters(request):
     """List available adapter types."""
+    if get_available_adapters is None:
+        return _error(500, _NO_FACTORY)
     try:
-        from adapter.factory import get_available_adapters
-        adapters = get_available_adapters()
-        return web.json_response(adapters)
+        adapters = _cached_adapters()
+        return _json(adapters)
     except Exception as e:
         return web.Response(status=500, text=str(e))
 
 
 async def api_adapter_status(request):
     """Get current adapter preference and test connectivity."""
+    if test_adapter_connectivity is None:
+        return _error(500, _NO_FACTORY)
     try:
-        from adapter.factory import test_adapter_connectivity
-        
-        adapter_config = request.app.get('adapter_config', {})
+        adapter_config = request.app['adapter_config']
         preferred = adapter_config.get('preferred')
-        connectivity = await test_adapter_connectivity()
+        connectivity = await _shared_connectivity()
         
-        return web.json_response({
+        return _json({
             'preferred': preferred,
             'connectivity': connectivity
         })
@@ -156,21 +500,24 @@ async def api_adapter_status(request):
 async def api_select_adapter(request):
     """Set the preferred adapter type."""
     try:
-        data = await request.json()
+        data = await _read_json(request)
+        if data is None:
+            return _error(400, _BAD_JSON)
         adapter_type = data.get('adapter')
         
-        if adapter_type not in [None, 'pico', 'joycontrol']:
-            return web.Response(status=400, text='Invalid adapter type')
+        # None or a str only; anything else is unhashable or never valid
+        if (adapter_type is not None and not isinstance(adapter_type, str)) or adapter_type not in _ADAPTER_TYPES:
+            return _error(400, _BAD_ADAPTER)
         
         # Update the app's preferred adapter
-        adapter_config = request.app.get('adapter_config', {})
+        adapter_config = request.app['adapter_config']
         adapter_config['preferred'] = adapter_type
         
         # Send command to worker to notify about adapter change
-        cmd_q: 'queue.Queue' = request.app['cmd_q']
-        cmd_q.put(f'adapter:{adapter_type}')
+        if not _enqueue(request.app, ('adapter', adapter_type)):
+            return _error(503, _BUSY)
         
-        return web.json_response({
+        return _json({
             'preferred': adapter_type,
             'message': 'Adapter preference updated. Restart the system to take effect.'
         })
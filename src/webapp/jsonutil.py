@@ -0,0 +1,27 @@
+"""JSON helpers shared by the web handlers and log broadcaster.
+
+Uses orjson when it is installed and falls back to the stdlib json module
+otherwise, so the web UI keeps working on hosts without the extra wheel.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if orjson is not None:
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError / ValueError
+    loads = orjson.loads
+    dumpb = orjson.dumps
+else:
+    loads = json.loads
+    # compact, UTF-8 output to match what orjson produces
+    _encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+
+    def dumpb(obj: Any) -> bytes:
+        return _encoder.encode(obj).encode('utf-8')
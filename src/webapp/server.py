@@ -1,74 +1,163 @@
 """Launcher for the web control UI.
 
-This module sets up thread-safe queues, starts the worker thread and
+This module sets up the command channel and log sinks, starts the worker thread and
 exposes start_server(macro_file, host, port) which runs the aiohttp app.
 """
 from __future__ import annotations
 
 import asyncio
+import concurrent.futures
+import itertools
 import threading
-import queue
 import time
 from aiohttp import web
 
 from . import handlers
 from . import worker
 
+try:
+    import uvloop
+except ImportError:  # optional, see web.py
+    uvloop = None
+
+# Registered in one add_routes() call; literal paths resolve through
+# aiohttp's plain-resource lookup rather than a regex match.
+ROUTES = (
+    web.get('/', handlers.index, name='index'),
+    web.get('/ws', handlers.websocket_handler, name='ws'),
+    web.static('/static/', handlers.STATIC_DIR, name='static', follow_symlinks=False),
+    web.get('/api/macros', handlers.api_list_macros, name='list_macros'),
+    web.get('/api/macros/{name}', handlers.api_get_macro, name='get_macro'),
+    web.post('/api/macros', handlers.api_save_macro, name='save_macro'),
+    web.post('/api/select', handlers.api_select_macro, name='select_macro'),
+    web.post('/api/stop', handlers.api_stop, name='stop'),
+    web.post('/api/restart_host', handlers.api_restart_host, name='restart_host'),
+    web.post('/api/stop_host', handlers.api_stop_host, name='stop_host'),
+    web.get('/api/adapters', handlers.api_list_adapters, name='list_adapters'),
+    web.get('/api/adapters/status', handlers.api_adapter_status, name='adapter_status'),
+    web.post('/api/adapters/select', handlers.api_select_adapter, name='select_adapter'),
+    web.get('/api/status', handlers.api_status, name='status'),
+)
+
+
+# Threads in the worker loop's default executor
+_WORKER_IO_THREADS = 4
+# Commands that may wait for the batcher before new ones are refused
+_CMD_BACKLOG = 64
+
 
 async def start_server(macro_file: str | None, host: str = '0.0.0.0', port: int = 8080):
-    cmd_q: 'queue.Queue' = queue.Queue()
-    logs_term_q: 'queue.Queue' = queue.Queue()
-    logs_ws_q: 'queue.Queue' = queue.Queue()
+    cmd_q = worker.CommandChannel()
+    loop = asyncio.get_running_loop()
+    macro_status = worker.MacroStatus()
+    # the worker thread pushes every log item into this one sink, encoded
+    # once as (terminal line, websocket frame); log_broadcaster awaits
+    # get_batch() directly, without an executor thread
+    logs_q = worker.LogSink(loop, status=macro_status, encode=worker.as_log_entry)
+
+    # ws -> (that client's outgoing frame queue, whether it takes
+    # zlib-compressed batches)
+    websocket_connections: dict = {}
 
-    async def terminal_log_printer():
-        loop = asyncio.get_event_loop()
+    async def log_broadcaster():
         while True:
-            msg = await loop.run_in_executor(None, logs_term_q.get)
-            print(msg)
+            # already encoded by the sink on the worker thread; everything
+            # queued since the last wake-up goes out as one frame
+            entries = await logs_q.get_batch()
+            print('\n'.join([line for line, _ in entries]))
+            if not websocket_connections:
+                # nobody to send to: skip the collapse, join and compression
+                continue
+            # a run of identical lines (e.g. the same PRESS repeated) goes
+            # out once with a count instead of once per line
+            batch = []
+            for frame, run in itertools.groupby(frame for _, frame in entries):
+                n = sum(1 for _ in run)
+                batch.append(frame if n == 1 else frame[:-1] + b',"count":%d}' % n)
+            if len(batch) == 1:
+                payload = zpayload = batch[0]
+            else:
+                payload = worker.as_batch_payload(batch)
+                zpayload = None
+            # each client drains its own queue in a sender task, so this
+            # loop never awaits and one slow client cannot hold up the rest;
+            # a client whose queue is full loses its oldest frames instead
+            for ws_q, deflate in websocket_connections.values():
+                if deflate:
+                    # compressed at most once, and only if someone takes it
+                    if zpayload is None:
+                        zpayload = worker.compress_frame(payload)
+                    handlers.push_frame(ws_q, zpayload)
+                else:
+                    handlers.push_frame(ws_q, payload)
+
+
+    # Handlers post commands here; the batcher forwards everything that
+    # arrives within a short window to the worker thread as one list, so a
+    # burst of UI actions costs a single cross-thread handoff.
+    # Bounded so a flood of requests is refused (503) instead of queued.
+    cmd_pending: asyncio.Queue = asyncio.Queue(maxsize=_CMD_BACKLOG)
+
+    async def command_batcher():
+        while True:
+            batch = [await cmd_pending.get()]
+            await asyncio.sleep(0.002)
+            while True:
+                try:
+                    batch.append(cmd_pending.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            cmd_q.put(batch)
 
-    term_logger = asyncio.create_task(terminal_log_printer())
 
-    macro_status = worker.MacroStatus()
-    
     # Store adapter preference in a mutable container (None = auto-detect, prioritizing Pico)
     adapter_config = {'preferred': None}
 
     def _start_worker():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(worker.worker_main(macro_file, cmd_q, [logs_term_q, logs_ws_q,], status=macro_status, preferred_adapter=adapter_config['preferred']))
+        # same kind of loop as ours: uvloop when the launcher runs the
+        # server on it, whether or not the uvloop policy is installed
+        if uvloop is not None and isinstance(loop, uvloop.Loop):
+            worker_loop = uvloop.new_event_loop()
+        else:
+            worker_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(worker_loop)
+        # the worker's blocking calls (serial port lookup, open and writes)
+        # go through to_thread; give them a small named pool instead of the
+        # default cpu_count()+4 one
+        io_pool = concurrent.futures.ThreadPoolExecutor(max_workers=_WORKER_IO_THREADS, thread_name_prefix='worker-io')
+        worker_loop.set_default_executor(io_pool)
+        try:
+            worker_loop.run_until_complete(worker.worker_main(macro_file, cmd_q, [logs_q], status=macro_status, preferred_adapter=adapter_config['preferred']))
+        finally:
+            io_pool.shutdown(wait=False)
 
-    worker_thread = threading.Thread(target=_start_worker, daemon=True)
+    worker_thread = threading.Thread(target=_start_worker, name='macro-worker', daemon=True)
     worker_thread.start()
 
-    app = web.Application()
-    app['cmd_q'] = cmd_q
-    app['logs_ws_q'] = logs_ws_q
+    # Loop-bound state is created once the runner starts the app and torn
+    # down by its cleanup, rather than in the body of start_server
+    async def _on_startup(app):
+        # Always installed, so handlers index this key without a None fallback
+        app['shutdown_event'] = asyncio.Event()
+        app['log_broadcaster'] = asyncio.create_task(log_broadcaster(), name='log-broadcaster')
+        app['command_batcher'] = asyncio.create_task(command_batcher(), name='command-batcher')
+        await asyncio.to_thread(handlers.precompress_static)
+
+    async def _on_cleanup(app):
+        tasks = (app['log_broadcaster'], app['command_batcher'])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    app = web.Application(middlewares=[handlers.static_cache])
+    app['cmd_pending'] = cmd_pending
+    app['websocket_connections'] = websocket_connections
     app['macro_status'] = macro_status
-    app['shutdown_event'] = asyncio.Event()
     app['adapter_config'] = adapter_config
+    app.on_startup.append(_on_startup)
+    app.on_cleanup.append(_on_cleanup)
 
-    app.router.add_get('/', handlers.index)
-    app.router.add_get('/ws', handlers.websocket_handler)
-    
-    # Add static file routes
-    import pathlib
-    static_dir = pathlib.Path(__file__).parent / 'static'
-    app.router.add_static('/static/', static_dir, name='static')
-    app.router.add_get('/api/macros', handlers.api_list_macros)
-    app.router.add_get('/api/macros/{name}', handlers.api_get_macro)
-    app.router.add_post('/api/macros', handlers.api_save_macro)
-    app.router.add_post('/api/select', handlers.api_select_macro)
-    app.router.add_post('/api/stop', handlers.api_stop)
-    app.router.add_post('/api/restart_host', handlers.api_restart_host)
-    app.router.add_post('/api/stop_host', handlers.api_stop_host)
-    app.router.add_get('/api/adapters', handlers.api_list_adapters)
-    app.router.add_get('/api/adapters/status', handlers.api_adapter_status)
-    app.router.add_post('/api/adapters/select', handlers.api_select_adapter)
-
-    async def api_status(request):
-        return web.json_response(request.app['macro_status'].to_dict())
-    app.router.add_get('/api/status', api_status)
+    app.add_routes(ROUTES)
 
     app_runner = web.AppRunner(app)
     await app_runner.setup()
@@ -78,7 +167,6 @@ async def start_server(macro_file: str | None, host: str = '0.0.0.0', port: int
     try:
         await app['shutdown_event'].wait()
     finally:
-        term_logger.cancel()
         try:
             cmd_q.put('stop')
         except Exception:
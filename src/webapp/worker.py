@@ -1,25 +1,107 @@
 """Worker logic that runs in a separate thread with its own asyncio loop.
 
 This file contains worker_main() which creates the adapter, MacroRunner and
-forwards logs to thread-safe queues. It also listens to a thread-safe cmd_q.
+forwards logs to thread-safe queues or LogSinks. It also listens for commands on a
+CommandChannel (cmd_q) fed by the web server thread.
 """
 from __future__ import annotations
 
 import asyncio
+import collections
+import functools
+import os
 import pathlib
+import threading
 import traceback
+import zlib
 import time
-import queue
 from typing import Optional
 
 from macros.parser import parse_macro
 from macros.runner import MacroRunner
 from adapter.factory import create_adapter
 
+from .jsonutil import dumpb
+
+# load commands only ever read from the data directory, never from code
+_MACROS_DIR = (pathlib.Path(__file__).parent.parent.parent / 'data' / 'macros').resolve()
+
+
+class CommandChannel:
+    """Command pipe from the web server thread to the worker thread.
+
+    The worker owns an asyncio.Queue on its own loop and awaits it
+    directly; put() from the server thread hands items over with
+    call_soon_threadsafe, so no executor thread sits blocked waiting for
+    commands. Items put before the worker has called bind() are kept and
+    delivered once it does.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._early: collections.deque = collections.deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+
+    def bind(self) -> None:
+        """Attach the channel to the running (worker) loop."""
+        q: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            while self._early:
+                q.put_nowait(self._early.popleft())
+            self._queue = q
+            self._loop = asyncio.get_running_loop()
+
+    def put(self, item) -> None:
+        with self._lock:
+            if self._loop is None:
+                self._early.append(item)
+                return
+        # raises RuntimeError once the worker loop has been closed
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+
+    async def get(self):
+        """Wait for the next item; only valid on the loop that called bind()."""
+        return await self._queue.get()
+
+
+_LOG_PREFIX = b'{"type":"log","msg":'
+
+
+def as_log_payload(msg) -> bytes:
+    """Encode a worker log item as a websocket frame.
+
+    The worker sends plain strings for log lines and ready-made dicts for
+    other frame types (e.g. status changes).
+    """
+    if isinstance(msg, dict):
+        return dumpb(msg)
+    # only the text needs encoding; the envelope around it never changes
+    return _LOG_PREFIX + dumpb(msg) + b'}'
+
+
+# Per-run token in status ETags, so an ETag from a previous server run
+# never matches one from this run (_gen restarts at 0)
+_ETAG_BOOT = format(time.time_ns(), 'x')
+
 
 class MacroStatus:
+    # Every attribute write bumps _gen; encoded() reuses its last encoding
+    # while _gen and the (whole-second) runtime string are unchanged, so
+    # idle or repeated /api/status polls skip the dict build and dumps.
+    _gen = 0
+    _json_cache = None
+    # (whole seconds, formatted) from the last _runtime() call
+    _runtime_cache = (-1, '')
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        object.__setattr__(self, '_gen', self._gen + 1)
+
     def __init__(self):
         self.name = None
+        # start_time, last_iter_time and pause_start are time.monotonic()
+        # readings, only ever subtracted from each other
         self.start_time = None
         self.iterations = 0
         self.last_iter_time = None
@@ -27,34 +109,197 @@ class MacroStatus:
         self.paused = False
         self.pause_start = None
         self.paused_total = 0.0
-    def to_dict(self):
-        runtime = '-'
-        if self.start_time is not None:
-            now = time.time()
-            total_paused = self.paused_total
-            if self.paused and self.pause_start is not None:
-                total_paused += (now - self.pause_start)
-            dt = int(now - self.start_time - total_paused)
-            h, m, s = dt//3600, (dt%3600)//60, dt%60
-            runtime = f"{h:02}:{m:02}:{s:02}"
+        # log lines LogSink had to drop because the websocket side lagged
+        self.dropped_logs = 0
+
+    def _runtime(self) -> str:
+        if self.start_time is None:
+            return '-'
+        now = time.monotonic()
+        total_paused = self.paused_total
+        if self.paused and self.pause_start is not None:
+            total_paused += (now - self.pause_start)
+        dt = int(now - self.start_time - total_paused)
+        cached = self._runtime_cache
+        if cached[0] == dt:
+            return cached[1]
+        h, m, s = dt//3600, (dt%3600)//60, dt%60
+        text = f"{h:02}:{m:02}:{s:02}"
+        object.__setattr__(self, '_runtime_cache', (dt, text))
+        return text
+
+    def to_dict(self, runtime: Optional[str] = None):
         return {
             'name': self.name,
-            'runtime': runtime,
+            'runtime': self._runtime() if runtime is None else runtime,
             'iterations': self.iterations,
             'sec_per_iter': round(self.sec_per_iter, 2) if self.sec_per_iter is not None else None,
+            'dropped_logs': self.dropped_logs,
         }
 
+    def encoded(self) -> tuple:
+        """Return ``(etag, body)`` for to_dict(), cached between changes.
 
-async def worker_main(macro_file: Optional[str], cmd_q: 'queue.Queue', logs_qs: list, status: Optional[MacroStatus]=None, preferred_adapter: Optional[str]=None):
-    try:
-        for q in logs_qs:
+        The ETag changes whenever the body does, so HTTP clients can
+        revalidate with If-None-Match instead of downloading it again.
+        """
+        # read the generation first: a write from the worker thread while
+        # encoding leaves a stale _gen in the cache entry, forcing a rebuild
+        gen = self._gen
+        runtime = self._runtime()
+        cached = self._json_cache
+        if cached is not None and cached[0] == gen and cached[1] == runtime:
+            return cached[2], cached[3]
+        body = dumpb(self.to_dict(runtime))
+        etag = f'"{_ETAG_BOOT}-{gen}-{runtime}"'
+        # bypass __setattr__ so caching does not count as a change
+        object.__setattr__(self, '_json_cache', (gen, runtime, etag, body))
+        return etag, body
+
+
+# Batch frames at least this long are zlib-compressed for clients that
+# asked for it (see compress_frame)
+_COMPRESS_MIN = 1024
+
+
+def as_batch_payload(payloads: list) -> bytes:
+    """Join already-encoded frames into one ``{"type": "batch"}`` frame.
+
+    The items are spliced in as-is, so nothing is decoded or re-encoded.
+    """
+    return b'{"type":"batch","msgs":[' + b','.join(payloads) + b']}'
+
+
+def compress_frame(frame: bytes) -> bytes:
+    """Return frame zlib-compressed if it is large enough to be worth it.
+
+    Done once per broadcast rather than per client by permessage-deflate;
+    only pages that can inflate it (DecompressionStream) opt in, and they
+    tell compressed frames apart by the zlib header.
+    """
+    if len(frame) >= _COMPRESS_MIN:
+        return zlib.compress(frame, 1)
+    return frame
+
+
+def as_terminal_line(msg) -> str:
+    """Format a worker log item for the server's stdout."""
+    return f"[{msg['type']}] {msg['msg']}" if isinstance(msg, dict) else msg
+
+
+def as_log_entry(msg) -> tuple:
+    """Encode a worker log item once for both the terminal and websockets."""
+    return as_terminal_line(msg), as_log_payload(msg)
+
+
+class LogSink:
+    """Log pipe from the worker thread to a coroutine on the server loop.
+
+    The worker calls put_nowait()/put() like it would on a queue.Queue.
+    Items are converted with ``encode`` (as_log_payload() by default) and
+    appended to a deque on the worker thread; the server loop is only
+    poked with call_soon_threadsafe when no wake-up is already pending, so
+    a burst of lines costs one loop wake-up and the consumer takes them
+    all at once with ``await sink.get_batch()``.
+
+    The buffer is bounded: when the consumer falls behind, new lines are
+    dropped and counted rather than piling up in memory. Once there is
+    room again a single "[N log lines dropped]" line is queued ahead of
+    the next message, and the running total is kept on ``status`` (if
+    given) so /api/status reports it.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int = 10_000, status: Optional[MacroStatus] = None, encode=as_log_payload):
+        self._loop = loop
+        self._encode = encode
+        self._maxsize = maxsize
+        self._status = status
+        self._items: collections.deque = collections.deque()
+        self._unreported = 0
+        # set by the producer when it schedules _wake, cleared by _wake
+        self._wake_pending = False
+        self._waiter: Optional[asyncio.Future] = None
+
+    def put_nowait(self, item) -> None:
+        # worker thread: deque.append is atomic, the counters are only
+        # touched here
+        items = self._items
+        if len(items) >= self._maxsize:
+            self._unreported += 1
+            if self._status is not None:
+                self._status.dropped_logs += 1
+            return
+        if self._unreported:
+            items.append(self._encode(f'[{self._unreported} log lines dropped]'))
+            self._unreported = 0
+        items.append(self._encode(item))
+        # append before checking the flag: a _wake that already ran left it
+        # False and gets rescheduled, one still queued will see this item
+        if not self._wake_pending:
+            self._wake_pending = True
+            self._loop.call_soon_threadsafe(self._wake)
+
+    put = put_nowait
+
+    def _wake(self) -> None:
+        self._wake_pending = False
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def get_batch(self) -> list:
+        """Wait until something is buffered and return everything queued."""
+        items = self._items
+        while not items:
+            self._waiter = self._loop.create_future()
             try:
-                q.put_nowait('worker: starting')
-            except Exception:
-                try:
-                    q.put('worker: starting')
-                except Exception:
-                    pass
+                await self._waiter
+            finally:
+                self._waiter = None
+        return [items.popleft() for _ in range(len(items))]
+
+
+# MacroRunner's per-iteration marker; compared by slice in forward_rlogs
+_ITER_PREFIX = '=== iteration'
+_ITER_PREFIX_LEN = len(_ITER_PREFIX)
+
+# publish_state() messages, built once; sinks encode them without mutating
+_STATE_MSGS = {state: {'type': 'status', 'msg': state} for state in ('running', 'paused', 'stopped')}
+
+
+def _fanout(qs, msg) -> None:
+    """Hand msg to every sink in qs; a sink that cannot take it misses it."""
+    for q in qs:
+        try:
+            q.put_nowait(msg)
+        except RuntimeError:
+            # LogSink wakes the server loop with call_soon_threadsafe, which
+            # raises once that loop is closed; the daemon worker can still be
+            # logging during shutdown, and those lines have nowhere to go.
+            # (LogSink counts its own overflow, so there is no queue.Full.)
+            pass
+
+
+@functools.lru_cache(maxsize=16)
+def _parse_macro_file(path: str, mtime_ns: int, size: int) -> list:
+    # mtime and size are only part of the key: an edited file misses
+    return parse_macro(pathlib.Path(path).read_text())
+
+
+def _load_macro(path) -> list:
+    """Read and parse a macro file; blocking, run it through to_thread.
+
+    Reloading an unchanged file (restart, toggling between macros) reuses
+    the parsed commands; the runner only iterates them, so sharing is safe.
+    """
+    st = os.stat(path)
+    return _parse_macro_file(str(path), st.st_mtime_ns, st.st_size)
+
+
+async def worker_main(macro_file: Optional[str], cmd_q: CommandChannel, logs_qs: list, status: Optional[MacroStatus]=None, preferred_adapter: Optional[str]=None):
+    cmd_q.bind()
+    try:
+        _fanout(logs_qs, 'worker: starting')
 
         commands = []
         if macro_file:
@@ -64,49 +309,14 @@ async def worker_main(macro_file: Optional[str], cmd_q: 'queue.Queue', logs_qs:
                     text = p.read_text()
                     commands = parse_macro(text)
                 else:
-                    for q in logs_qs:
-                        try:
-                            q.put_nowait(f'Initial macro not found: {macro_file}')
-                        except Exception:
-                            try:
-                                q.put(f'Initial macro not found: {macro_file}')
-                            except Exception:
-                                pass
+                    _fanout(logs_qs, f'Initial macro not found: {macro_file}')
             except Exception as e:
-                for q in logs_qs:
-                    try:
-                        q.put_nowait(f'Error reading initial macro {macro_file}: {e}')
-                    except Exception:
-                        try:
-                            q.put(f'Error reading initial macro {macro_file}: {e}')
-                        except Exception:
-                            pass
-        for q in logs_qs:
-            try:
-                q.put_nowait(f'worker: parsed {len(commands)} commands')
-            except Exception:
-                try:
-                    q.put(f'worker: parsed {len(commands)} commands')
-                except Exception:
-                    pass
+                _fanout(logs_qs, f'Error reading initial macro {macro_file}: {e}')
+        _fanout(logs_qs, f'worker: parsed {len(commands)} commands')
 
-        for q in logs_qs:
-            try:
-                q.put_nowait('worker: creating and connecting adapter (prioritizing Pico)')
-            except Exception:
-                try:
-                    q.put('worker: creating and connecting adapter (prioritizing Pico)')
-                except Exception:
-                    pass
+        _fanout(logs_qs, 'worker: creating and connecting adapter (prioritizing Pico)')
         adapter = await create_adapter(preferred_adapter)  # Factory handles connection automatically
-        for q in logs_qs:
-            try:
-                q.put_nowait('worker: adapter connected')
-            except Exception:
-                try:
-                    q.put('worker: adapter connected')
-                except Exception:
-                    pass
+        _fanout(logs_qs, 'worker: adapter connected')
 
         app_status = status if status is not None else MacroStatus()
 
@@ -120,149 +330,145 @@ async def worker_main(macro_file: Optional[str], cmd_q: 'queue.Queue', logs_qs:
                     msg = await rlogs.get()
                 except asyncio.CancelledError:
                     break
+                # the runner only emits command echoes and the iteration
+                # marker; 'Loaded macro' lines come from cmd_handler, which
+                # resets the status itself, so one prefix check is enough
                 try:
-                    if msg.startswith('=== iteration'):
+                    # a slice compare is cheaper than startswith() on the
+                    # common miss (every command echo)
+                    if msg[:_ITER_PREFIX_LEN] == _ITER_PREFIX:
                         st = app_status
-                        now = time.time()
+                        now = time.monotonic()
                         if st.start_time is None:
                             st.start_time = now
                         if st.last_iter_time is not None:
                             st.sec_per_iter = now - st.last_iter_time
                         st.last_iter_time = now
                         st.iterations += 1
-                    if msg.startswith('Loaded macro:'):
-                        parts = msg.split(':',1)[1].strip().split(' ',1)
-                        st = app_status
-                        st.name = parts[0]
-                        st.start_time = None
-                        st.iterations = 0
-                        st.last_iter_time = None
-                        st.sec_per_iter = None
                 except Exception:
                     pass
-                for q in logs_qs:
-                    try:
-                        q.put_nowait(msg)
-                    except Exception:
-                        try:
-                            q.put(msg)
-                        except Exception:
-                            pass
+                _fanout(logs_qs, msg)
+
+        def publish_state(state: str):
+            _fanout(logs_qs, _STATE_MSGS[state])
 
-        loop = asyncio.get_event_loop()
+        # cmd_q carries either a single command or a list batched by the
+        # server; batches are unpacked here and handled one at a time.
+        # Simple commands are plain strings, commands with arguments are
+        # tagged tuples such as ('load', name) or ('adapter', kind).
+        pending_cmds: collections.deque = collections.deque()
+
+        async def on_pause(_):
+            try:
+                was_paused = app_status.paused
+                try:
+                    app_status.paused = True
+                    app_status.pause_start = time.monotonic()
+                except Exception:
+                    pass
+                await runner.pause()
+                if not was_paused:
+                    publish_state('paused')
+            except Exception as e:
+                _fanout(logs_qs, f'Error pausing runner: {e}')
+
+        async def on_resume(_):
+            was_paused = app_status.paused
+            try:
+                if app_status.paused and app_status.pause_start is not None:
+                    app_status.paused_total = (app_status.paused_total or 0.0) + (time.monotonic() - app_status.pause_start)
+                app_status.paused = False
+                app_status.pause_start = None
+            except Exception:
+                pass
+            runner.resume()
+            if was_paused:
+                publish_state('running')
+
+        async def on_restart(_):
+            try:
+                await runner.restart()
+                publish_state('running')
+            except Exception as e:
+                _fanout(logs_qs, f'Error restarting: {e}')
+
+        async def on_stop(_):
+            await runner.stop()
+            publish_state('stopped')
+
+        async def on_adapter(new_adapter):
+            # Handle adapter switching - this would require restarting the entire worker
+            # For now, just log it - full implementation would require more complex worker management
+            _fanout(logs_qs, f'Adapter change requested: {new_adapter}. Please restart the system.')
+
+        async def on_load(name):
+            try:
+                mpath = _MACROS_DIR / pathlib.PurePath(name).name
+                # off the loop, so forward_rlogs keeps draining while
+                # the file is read and parsed
+                new_commands = await asyncio.to_thread(_load_macro, mpath)
+                runner.set_commands(new_commands)
+                await runner.restart()
+                try:
+                    app_status.name = name
+                    app_status.start_time = None
+                    app_status.iterations = 0
+                    app_status.last_iter_time = None
+                    app_status.sec_per_iter = None
+                    app_status.paused = False
+                    app_status.pause_start = None
+                    app_status.paused_total = 0.0
+                except Exception:
+                    pass
+                publish_state('running')
+                _fanout(logs_qs, f'Loaded macro: {name} ({len(new_commands)} commands)')
+            except Exception as e:
+                _fanout(logs_qs, f'Error loading macro {name}: {e}')
+
+        # keyed on the plain command, or on the tag of a tuple command;
+        # each handler gets the tuple's argument (None for plain ones)
+        cmd_handlers = {
+            'pause': on_pause,
+            'resume': on_resume,
+            'restart': on_restart,
+            'stop': on_stop,
+            'adapter': on_adapter,
+            'load': on_load,
+        }
 
         async def cmd_handler():
             while True:
-                cmd = await loop.run_in_executor(None, cmd_q.get)
-                for q in logs_qs:
-                    try:
-                        q.put_nowait(f'worker: got cmd: {cmd}')
-                    except Exception:
-                        try:
-                            q.put(f'worker: got cmd: {cmd}')
-                        except Exception:
-                            pass
-                if cmd == 'pause':
-                    try:
-                        try:
-                            app_status.paused = True
-                            app_status.pause_start = time.time()
-                        except Exception:
-                            pass
-                        await runner.pause()
-                    except Exception as e:
-                        for q in logs_qs:
-                            try:
-                                q.put_nowait(f'Error pausing runner: {e}')
-                            except Exception:
-                                try:
-                                    q.put(f'Error pausing runner: {e}')
-                                except Exception:
-                                    pass
-                elif cmd == 'resume':
-                    try:
-                        if app_status.paused and app_status.pause_start is not None:
-                            app_status.paused_total = (app_status.paused_total or 0.0) + (time.time() - app_status.pause_start)
-                        app_status.paused = False
-                        app_status.pause_start = None
-                    except Exception:
-                        pass
-                    runner.resume()
-                elif cmd == 'restart':
-                    try:
-                        await runner.restart()
-                    except Exception as e:
-                        for q in logs_qs:
-                            try:
-                                q.put_nowait(f'Error restarting: {e}')
-                            except Exception:
-                                try:
-                                    q.put(f'Error restarting: {e}')
-                                except Exception:
-                                    pass
-                elif cmd == 'stop':
-                    await runner.stop()
+                if not pending_cmds:
+                    item = await cmd_q.get()
+                    pending_cmds.extend(item if isinstance(item, list) else (item,))
+                cmd = pending_cmds.popleft()
+                if isinstance(cmd, tuple):
+                    key, arg = cmd[0], cmd[1]
+                    label = ':'.join(map(str, cmd))
+                else:
+                    key = label = cmd
+                    arg = None
+                _fanout(logs_qs, f'worker: got cmd: {label}')
+                handler = cmd_handlers.get(key)
+                if handler is not None:
+                    await handler(arg)
+                if key == 'stop':
                     break
-                elif isinstance(cmd, str) and cmd.startswith('adapter:'):
-                    # Handle adapter switching - this would require restarting the entire worker
-                    # For now, just log it - full implementation would require more complex worker management
-                    new_adapter = cmd.split(':', 1)[1] if ':' in cmd else None
-                    for q in logs_qs:
-                        try:
-                            q.put_nowait(f'Adapter change requested: {new_adapter}. Please restart the system.')
-                        except Exception:
-                            try:
-                                q.put(f'Adapter change requested: {new_adapter}. Please restart the system.')
-                            except Exception:
-                                pass
-                elif isinstance(cmd, str) and cmd.startswith('load:'):
-                    name = cmd.split(':',1)[1]
-                    try:
-                        from pathlib import Path
-                        # load macros from the data directory to avoid mixing code and data
-                        mpath = Path(pathlib.Path(__file__).parent.parent.parent) / 'data' / 'macros' / Path(name).name
-                        text = mpath.read_text()
-                        new_commands = parse_macro(text)
-                        runner.set_commands(new_commands)
-                        await runner.restart()
-                        try:
-                            app_status.name = name
-                            app_status.start_time = None
-                            app_status.iterations = 0
-                            app_status.last_iter_time = None
-                            app_status.sec_per_iter = None
-                            app_status.paused = False
-                            app_status.pause_start = None
-                            app_status.paused_total = 0.0
-                        except Exception:
-                            pass
-                        for q in logs_qs:
-                            try:
-                                q.put_nowait(f'Loaded macro: {name} ({len(new_commands)} commands)')
-                            except Exception:
-                                try:
-                                    q.put(f'Loaded macro: {name} ({len(new_commands)} commands)')
-                                except Exception:
-                                    pass
-                    except Exception as e:
-                        for q in logs_qs:
-                            try:
-                                q.put_nowait(f'Error loading macro {name}: {e}')
-                            except Exception:
-                                try:
-                                    q.put(f'Error loading macro {name}: {e}')
-                                except Exception:
-                                    pass
 
         await runner.start()
-        await asyncio.gather(forward_rlogs(), cmd_handler())
+        # forward_rlogs never returns on its own; wake on whichever task
+        # finishes first (cmd_handler after 'stop', or either one failing)
+        # and cancel the other so worker_main can exit
+        tasks = {
+            asyncio.create_task(forward_rlogs(), name='forward-rlogs'),
+            asyncio.create_task(cmd_handler(), name='cmd-handler'),
+        }
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for t in pending:
+            t.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for t in done:
+            t.result()
     except Exception as e:
         tb = traceback.format_exc()
-        for q in logs_qs:
-            try:
-                q.put_nowait(f'Worker error: {e}\n{tb}')
-            except Exception:
-                try:
-                    q.put(f'Worker error: {e}\n{tb}')
-                except Exception:
-                    pass
+        _fanout(logs_qs, f'Worker error: {e}\n{tb}')
@@ -0,0 +1,119 @@
+"""Web control handlers, driven through aiohttp's test client."""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from webapp import handlers  # noqa: E402
+
+
+def _make_app() -> web.Application:
+    app = web.Application()
+    app['cmd_pending'] = asyncio.Queue()
+    app['websocket_connections'] = {}
+    app['adapter_config'] = {'preferred': None}
+    app.router.add_get('/ws', handlers.websocket_handler)
+    app.router.add_post('/api/adapters/select', handlers.api_select_adapter)
+    app.router.add_post('/api/restart_host', handlers.api_restart_host)
+    return app
+
+
+def _run(scenario):
+    async def main():
+        app = _make_app()
+        async with TestClient(TestServer(app)) as client:
+            return await scenario(app, client)
+    return asyncio.run(main())
+
+
+def test_ws_unhashable_cmd_is_ignored():
+    async def scenario(app, client):
+        ws = await client.ws_connect('/ws')
+        await ws.receive()  # greeting
+        await ws.send_str('{"cmd": []}')
+        await ws.send_str('{"cmd": "pause"}')
+        cmd = await asyncio.wait_for(app['cmd_pending'].get(), 2)
+        closed = ws.closed
+        await ws.close()
+        return cmd, closed
+
+    cmd, closed = _run(scenario)
+    assert cmd == 'pause'
+    assert not closed
+
+
+def test_select_adapter_rejects_unhashable():
+    async def scenario(app, client):
+        resp = await client.post('/api/adapters/select', json={'adapter': []})
+        return resp.status, await resp.text(), app['cmd_pending'].qsize()
+
+    status, text, pending = _run(scenario)
+    assert status == 400
+    assert text == 'Invalid adapter type'
+    assert pending == 0
+
+
+def test_select_adapter_accepts_known_type():
+    async def scenario(app, client):
+        resp = await client.post('/api/adapters/select', json={'adapter': 'pico'})
+        return resp.status, app['adapter_config']['preferred']
+
+    status, preferred = _run(scenario)
+    assert status == 200
+    assert preferred == 'pico'
+
+
+def test_listing_skips_names_the_endpoints_reject(tmp_path, monkeypatch):
+    for name in ('ok_macro.txt', 'my macro.txt', '.hidden.txt'):
+        (tmp_path / name).write_text('PRESS a\n')
+    monkeypatch.setattr(handlers, '_MACROS_DIR_STR', str(tmp_path))
+
+    assert handlers._scan_macros() == ['ok_macro.txt']
+
+
+def test_ws_compression_is_opt_in():
+    async def scenario(app, client):
+        plain = await client.ws_connect('/ws')
+        await plain.receive()
+        deflate = await client.ws_connect('/ws?z=1')
+        await deflate.receive()
+        flags = sorted(d for _, d in app['websocket_connections'].values())
+        await plain.close()
+        await deflate.close()
+        return flags
+
+    assert _run(scenario) == [False, True]
+
+
+def _fake_sudo(tmp_path, monkeypatch, script):
+    sudo = tmp_path / 'sudo'
+    sudo.write_text('#!/bin/sh\n' + script)
+    sudo.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{tmp_path}{os.pathsep}{os.environ["PATH"]}')
+
+
+def _post_restart_host():
+    async def scenario(app, client):
+        resp = await client.post('/api/restart_host')
+        return resp.status, await resp.text()
+    return _run(scenario)
+
+
+def test_power_command_reports_sudo_failure(tmp_path, monkeypatch):
+    _fake_sudo(tmp_path, monkeypatch, 'echo "sudo: a password is required" >&2\nexit 1\n')
+
+    status, text = _post_restart_host()
+
+    assert status == 500
+    assert text == 'sudo: a password is required'
+
+
+def test_power_command_success(tmp_path, monkeypatch):
+    _fake_sudo(tmp_path, monkeypatch, 'exit 0\n')
+
+    assert _post_restart_host() == (200, '')
@@ -0,0 +1,53 @@
+"""Pause/stop-aware SLEEP in the macro runner."""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from macros.runner import _sleep_unpaused  # noqa: E402
+
+
+def _events():
+    pause, stop, wake = asyncio.Event(), asyncio.Event(), asyncio.Event()
+    pause.set()  # set means running
+    return pause, stop, wake
+
+
+def test_sleep_wakes_immediately_on_stop():
+    async def main():
+        pause, stop, wake = _events()
+        loop = asyncio.get_running_loop()
+        task = asyncio.ensure_future(_sleep_unpaused(10.0, pause, stop, wake))
+        await asyncio.sleep(0.05)
+        start = loop.time()
+        stop.set()
+        wake.set()
+        stopped = await asyncio.wait_for(task, 1)
+        return stopped, loop.time() - start
+
+    stopped, took = asyncio.run(main())
+    assert stopped is True
+    assert took < 0.1
+
+
+def test_sleep_keeps_remaining_time_across_pause():
+    async def main():
+        pause, stop, wake = _events()
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        task = asyncio.ensure_future(_sleep_unpaused(0.3, pause, stop, wake))
+        await asyncio.sleep(0.1)
+        pause.clear()
+        wake.set()
+        await asyncio.sleep(0.3)
+        done_while_paused = task.done()
+        pause.set()
+        stopped = await asyncio.wait_for(task, 1)
+        return stopped, done_while_paused, loop.time() - start
+
+    stopped, done_while_paused, elapsed = asyncio.run(main())
+    assert stopped is False
+    assert not done_while_paused
+    # 0.1 s before the pause + 0.3 s paused + the remaining ~0.2 s
+    assert 0.55 <= elapsed < 0.8
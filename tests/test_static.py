@@ -0,0 +1,60 @@
+"""Precompressed static assets in the web control handlers."""
+import asyncio
+import gzip
+import logging
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from webapp import handlers  # noqa: E402
+
+
+def _touch(path, ns):
+    os.utime(path, ns=(ns, ns))
+
+
+def test_stale_gz_is_rewritten(tmp_path):
+    css = tmp_path / 'styles.css'
+    gz = tmp_path / 'styles.css.gz'
+    css.write_bytes(b'body{}')
+    handlers._write_gz(css)
+    css.write_bytes(b'body{color:red}')
+    _touch(css, gz.stat().st_mtime_ns + 10**9)
+
+    asyncio.run(handlers._refresh_gz(css))
+
+    assert gzip.decompress(gz.read_bytes()) == b'body{color:red}'
+    assert gz.stat().st_mtime_ns == css.stat().st_mtime_ns
+
+
+def test_fresh_gz_is_kept(tmp_path):
+    css = tmp_path / 'styles.css'
+    gz = tmp_path / 'styles.css.gz'
+    css.write_bytes(b'body{}')
+    gz.write_bytes(gzip.compress(b'sentinel'))
+    _touch(gz, css.stat().st_mtime_ns)
+
+    asyncio.run(handlers._refresh_gz(css))
+
+    assert gzip.decompress(gz.read_bytes()) == b'sentinel'
+
+
+def test_concurrent_refreshes_leave_one_valid_gz(tmp_path, caplog):
+    css = tmp_path / 'styles.css'
+    gz = tmp_path / 'styles.css.gz'
+    body = b'body{margin:0}' * 2000
+
+    async def refresh_all():
+        await asyncio.gather(*(handlers._refresh_gz(css) for _ in range(8)))
+
+    caplog.set_level(logging.WARNING, logger=handlers.__name__)
+    for i in range(50):
+        css.write_bytes(body + b'/*%d*/' % i)
+        _touch(css, 10**18 + i * 10**9)
+        asyncio.run(refresh_all())
+        assert gzip.decompress(gz.read_bytes()) == css.read_bytes()
+
+    assert not caplog.records
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['styles.css', 'styles.css.gz']
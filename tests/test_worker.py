@@ -0,0 +1,74 @@
+"""Cross-thread pipes between the web server and the macro worker."""
+import asyncio
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from webapp import worker  # noqa: E402
+
+
+def _in_thread(fn):
+    t = threading.Thread(target=fn)
+    t.start()
+    t.join()
+
+
+def test_log_sink_delivers_a_thread_burst_in_one_batch():
+    async def main():
+        loop = asyncio.get_running_loop()
+        wakes = []
+        call_soon_threadsafe = loop.call_soon_threadsafe
+
+        def counting(cb, *args):
+            wakes.append(cb)
+            return call_soon_threadsafe(cb, *args)
+
+        loop.call_soon_threadsafe = counting
+        sink = worker.LogSink(loop, encode=str)
+        _in_thread(lambda: [sink.put_nowait(f'line {i}') for i in range(500)])
+        burst_wakes = len(wakes)
+        first = await sink.get_batch()
+        # once the pending wake-up has run, the next put schedules another
+        await asyncio.sleep(0)
+        waiting = asyncio.ensure_future(sink.get_batch())
+        await asyncio.sleep(0)
+        _in_thread(lambda: sink.put_nowait('after'))
+        second = await asyncio.wait_for(waiting, 1)
+        return first, second, burst_wakes, len(wakes)
+
+    first, second, burst_wakes, wakes = asyncio.run(main())
+    assert first == [f'line {i}' for i in range(500)]
+    assert burst_wakes == 1
+    assert second == ['after']
+    assert wakes == 2
+
+
+def test_log_sink_overflow_reports_one_drop_notice():
+    async def main():
+        status = worker.MacroStatus()
+        sink = worker.LogSink(asyncio.get_running_loop(), maxsize=3, status=status, encode=str)
+        _in_thread(lambda: [sink.put_nowait(f'line {i}') for i in range(5)])
+        full = await sink.get_batch()
+        _in_thread(lambda: [sink.put_nowait('next'), sink.put_nowait('later')])
+        after = await sink.get_batch()
+        return full, after, status.dropped_logs
+
+    full, after, dropped = asyncio.run(main())
+    assert full == ['line 0', 'line 1', 'line 2']
+    assert after == ['[2 log lines dropped]', 'next', 'later']
+    assert dropped == 2
+
+
+def test_command_channel_delivers_early_items_in_order():
+    chan = worker.CommandChannel()
+    chan.put('pause')
+    chan.put(['resume', ('load', 'a.txt')])
+
+    async def main():
+        chan.bind()
+        _in_thread(lambda: chan.put('stop'))
+        return [await asyncio.wait_for(chan.get(), 1) for _ in range(3)]
+
+    assert asyncio.run(main()) == ['pause', ['resume', ('load', 'a.txt')], 'stop']
@@ -11,6 +11,11 @@ sys.path.insert(0, str(src_path))
 
 from webapp.server import start_server
 
+try:
+    import uvloop
+except ImportError:  # optional; the stdlib loop works, just slower
+    uvloop = None
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -18,4 +23,14 @@ if __name__ == '__main__':
     parser.add_argument('--host', default='0.0.0.0')
     parser.add_argument('--port', type=int, default=8080)
     args = parser.parse_args()
-    asyncio.run(start_server(args.macro_file, host=args.host, port=args.port))
\ No newline at end of file
+    server = start_server(args.macro_file, host=args.host, port=args.port)
+    if uvloop is not None and hasattr(uvloop, 'run'):
+        # start_server gives the worker thread a uvloop loop too once it
+        # sees the server running on one
+        uvloop.run(server)
+    elif uvloop is not None:
+        # uvloop < 0.18 has no run(); install() is deprecated from 3.12 on
+        uvloop.install()
+        asyncio.run(server)
+    else:
+        asyncio.run(server)